@@ -0,0 +1,64 @@
+"""Локальная замена Trefle API и хостинга изображений для нагрузочных тестов.
+
+Запуск: uvicorn bench.stub_trefle:app --port 9000
+"""
+import asyncio
+import os
+
+from fastapi import FastAPI, Response
+
+# Искусственная задержка ответа, чтобы имитировать сеть до Trefle
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0.05"))
+STUB_PAGE_SIZE = 20
+STUB_BASE_URL = os.getenv("STUB_BASE_URL", "http://127.0.0.1:9000")
+
+# Содержимое изображения: сервису важен только Content-Type, поэтому достаточно заглушки ~20 КБ
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + bytes(20 * 1024) + b"\xff\xd9"
+
+app = FastAPI()
+
+
+# Растение в формате Trefle
+def stub_plant(plant_id: int) -> dict:
+    return {
+        "id": plant_id,
+        "common_name": f"Plant {plant_id}",
+        "slug": f"stub-plant-{plant_id}",
+        "scientific_name": f"Plantae stubia {plant_id}",
+        "year": 1753,
+        "bibliography": "Sp. Pl.: 1 (1753)",
+        "author": "L.",
+        "status": "accepted",
+        "rank": "species",
+        "family_common_name": None,
+        "genus_id": 1,
+        "image_url": f"{STUB_BASE_URL}/images/{plant_id}.jpg",
+        "genus": "Stubia",
+        "family": "Stubaceae",
+        "links": {
+            "self": f"/api/v1/species/stub-plant-{plant_id}",
+            "plant": f"/api/v1/plants/stub-plant-{plant_id}",
+            "genus": "/api/v1/genus/stubia",
+        },
+    }
+
+
+# Страница растений, как /api/v1/plants
+@app.get("/api/v1/plants")
+async def plants(page: int = 1, token: str | None = None):
+    await asyncio.sleep(STUB_LATENCY)
+    if not token:
+        return Response(status_code=401, content='{"error": true, "message": "Unauthorized"}')
+    start = (page - 1) * STUB_PAGE_SIZE
+    return {
+        "data": [stub_plant(start + i + 1) for i in range(STUB_PAGE_SIZE)],
+        "links": {"self": f"/api/v1/plants?page={page}"},
+        "meta": {"total": 489360},
+    }
+
+
+# Изображение растения
+@app.get("/images/{name}")
+async def image(name: str):
+    await asyncio.sleep(STUB_LATENCY)
+    return Response(content=JPEG_BYTES, media_type="image/jpeg")
@@ -1,27 +1,36 @@
+import time
+
+# Момент начала импорта: от него считаем время холодного старта воркера
+BOOT_STARTED = time.monotonic()
+
+import asyncio
+import json
 import os
-from fastapi.responses import FileResponse
-import httpx
-import random
-from pathlib import Path
-from sqlalchemy import delete
+import re
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.future import select
 from models.log_middleware import LogMiddleware
+from models.admission_middleware import AdmissionMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Depends, HTTPException, status
-from models.models import Favorite, Plant, PlantUpdate, UserCreate, UserCreateAdmin, UserLogin, UserOut, User
-from models.token import create_access_token, get_current_user, verify_password, hash_password, router as token_router
-from models.database import create_tables, get_db
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from models.models import Favorite, Plant, PlantBatchUpdate, PlantUpdate, UserCreate, UserCreateAdmin, UserLogin, UserOut, User
+from models.token import create_access_token, create_refresh_token, get_current_admin, get_current_user, get_token_admin_id, get_token_user_id, verify_password, hash_password, router as token_router
+from models.database import get_db, invalidation_bus, ping_db, pool_stats, warm_pool
+from models.migrations import check_schema
+from models.trefle import TrefleError, TrefleUnavailable, trefle_client
+from models.prefetch import plant_prefetcher
+from models.diagnostics import loop_lag_monitor, profiler
+from models.events import CLOSE_EVENT, event_fanout
 from models.logger_config import setup_logger
-from sqlalchemy.orm import joinedload
-from dotenv import load_dotenv
+from sqlalchemy.orm import joinedload, selectinload
 from loguru import logger
 
+# Переменные окружения из .env уже загружены при импорте models
 log = setup_logger()
 
-# # Загрузка переменных окружения из файла .env
-load_dotenv()
-
 app = FastAPI(docs_url="/api/docs", redoc_url="/api/redoc")
 app.include_router(token_router)
 
@@ -33,6 +42,10 @@ origins = [
     "http://www.greenbook.space"   # Если используется HTTP для поддомена
 ]
 
+# Ограничение нагрузки на дорогие эндпоинты.
+# Регистрируется до CORS: CORS остается снаружи и добавляет заголовки и к ответам 429/503
+app.add_middleware(AdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,  # Список допустимых источников
@@ -42,8 +55,25 @@ app.add_middleware(
 )
 
 
-TREFLE_API_KEY = os.getenv("TREFLE_API_KEY")
-TREFLE_API_URL = "https://trefle.io/api/v1/plants"
+# Отдача изображений: "accel" — через nginx (X-Accel-Redirect), "direct" — из Python
+IMAGE_DIR = "image"
+IMAGE_DELIVERY = os.getenv("IMAGE_DELIVERY", "direct")
+IMAGE_ACCEL_PREFIX = os.getenv("IMAGE_ACCEL_PREFIX", "/internal/image/")
+# Имя файла — trefle_id растения, содержимое под одним именем не меняется
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_NAME_RE = re.compile(r"[\w-]+\.(jpg|jpeg|png)")
+
+# Таймаут проверки БД в /readyz (меньше таймаута healthcheck в docker-compose)
+READYZ_TIMEOUT = 2
+
+# Интервал комментариев-пингов в ленте событий (держит соединение через nginx)
+EVENTS_KEEPALIVE = 15
+
+# Максимальный размер пакетного обновления растений
+MAX_PLANT_BATCH = 5000
+
+# Размер страницы списка пользователей в админке
+MAX_USERS_PAGE = 500
 
 # Добавляем middleware
 app.add_middleware(LogMiddleware)
@@ -53,10 +83,51 @@ app.add_middleware(LogMiddleware)
 def root():
     return {"message": "Hello, World!"}
 
-# Стартовая инициализация таблиц БД
+
+# Проверка живости процесса (без обращения к БД)
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+
+# Проверка готовности: БД отвечает (схема проверена и пул прогрет один раз при старте)
+@app.get("/readyz")
+async def readyz():
+    try:
+        await asyncio.wait_for(ping_db(), READYZ_TIMEOUT)
+    except Exception as e:
+        log.error(f"Воркер не готов: {e}")
+        raise HTTPException(status_code=503, detail=f"Не готов: {e}")
+    return {"status": "ready", "cold_start": getattr(app.state, "cold_start", None)}
+
+
+# Стартовая инициализация: таблицы создают миграции (python -m models.migrations), здесь только проверка версии
 @app.on_event("startup")
 async def startup_event():
-    await create_tables()
+    await check_schema()
+    await warm_pool()
+    # Замер задержки event loop и поиск блокирующих вызовов
+    loop_lag_monitor.start()
+    # Подписка на события инвалидации от других воркеров
+    await invalidation_bus.start()
+    # Фоновое пополнение буфера случайных растений
+    plant_prefetcher.start()
+    # Ленты событий закрываются по сигналу остановки, до того как uvicorn начнет ждать соединения
+    event_fanout.close_on_exit_signals()
+
+    app.state.cold_start = time.monotonic() - BOOT_STARTED
+    log.info(f"Воркер готов за {app.state.cold_start:.3f}s от начала импорта")
+
+
+# Остановка фоновых задач и закрытие пула соединений с Trefle
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Ленты уже закрыты по сигналу; здесь — для серверов, которые вызывают shutdown без сигнала
+    event_fanout.close()
+    await plant_prefetcher.stop()
+    await invalidation_bus.stop()
+    await loop_lag_monitor.stop()
+    await trefle_client.aclose()
 
 
 ### --- ПОЛЬЗОВАТЕЛИ --- ###
@@ -74,8 +145,8 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
             status_code=400, detail="Имя пользователя уже занято"
         )
 
-    # Создание нового пользователя с хешированным паролем
-    hashed_password = hash_password(user.password)
+    # Создание нового пользователя с хешированным паролем (bcrypt в потоке, чтобы не блокировать event loop)
+    hashed_password = await asyncio.to_thread(hash_password, user.password)
     new_user = User(username=user.username, password=hashed_password)
     db.add(new_user)
     await db.commit()
@@ -84,10 +155,13 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     access_token = create_access_token(
         data={"sub": str(new_user.id), "role": new_user.role.value}
     )
+    refresh_token = await create_refresh_token(db, new_user.id)
+    await db.commit()
 
-    # Возвращаем токен, тип токена и роль пользователя
+    # Возвращаем токены, тип токена и роль пользователя
     return {
         "access_token": access_token,
+        "refresh_token": refresh_token,
         "token_type": "bearer",
         "role": new_user.role.value
     }
@@ -101,26 +175,43 @@ async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(User).filter_by(username=user.username))
     db_user = result.scalars().first()
 
-    if not db_user or not verify_password(user.password, db_user.password):
+    # bcrypt в потоке: иначе каждый вход останавливает event loop на сотни миллисекунд
+    if not db_user or not await asyncio.to_thread(verify_password, user.password, db_user.password):
         raise HTTPException(status_code=401, detail="Неверные учетные данные")
 
     # Генерация токена с добавлением роли пользователя
     access_token = create_access_token(
         data={"sub": str(db_user.id), "role": db_user.role.value}
     )
-    return {"access_token": access_token, "token_type": "bearer", "role": db_user.role.value}
+    refresh_token = await create_refresh_token(db, db_user.id)
+    await db.commit()
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "role": db_user.role.value,
+    }
 
 
 # Получить всех пользователей (только для администратора)
 @logger.catch
 @app.get("/api/admin/users")
-async def get_all_users(user_type: str = "admin", db: AsyncSession = Depends(get_db)):
+async def get_all_users(
+    user_type: str = "admin",
+    after_id: int | None = None,
+    limit: int = Query(100, ge=1, le=MAX_USERS_PAGE),
+    db: AsyncSession = Depends(get_db),
+):
+    """Пользователи страницами по id (after_id — id последнего пользователя предыдущей страницы)"""
     if user_type != "admin":
         raise HTTPException(
             status_code=403, detail="Только администратор может выполнять данную операцию.")
 
-    users_result = await db.execute(select(User).options(joinedload(User.favorites)))
-    users = users_result.unique().scalars().all()
+    query = select(User).options(selectinload(User.favorites)).order_by(User.id).limit(limit)
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    users_result = await db.execute(query)
+    users = users_result.scalars().all()
 
     return [
         {
@@ -150,6 +241,7 @@ async def delete_user(user_id: int, user_type: str = "admin", db: AsyncSession =
 
     # Удаление пользователя
     await db.delete(user)
+    await invalidation_bus.publish(db, "user_deleted", ids=[user_id])
     await db.commit()
 
     return {"message": f"Пользователь с ID {user_id} успешно удален."}
@@ -166,8 +258,8 @@ async def create_user(user: UserCreateAdmin, db: AsyncSession = Depends(get_db))
         raise HTTPException(
             status_code=400, detail="Имя пользователя уже занято"
         )
-    # Хеширование пароля
-    hashed_password = hash_password(user.password)
+    # Хеширование пароля (bcrypt в потоке)
+    hashed_password = await asyncio.to_thread(hash_password, user.password)
     # Создаем нового пользователя с указанной ролью
     new_user = User(username=user.username,
                     password=hashed_password,
@@ -177,6 +269,36 @@ async def create_user(user: UserCreateAdmin, db: AsyncSession = Depends(get_db))
     return new_user
 
 
+# Профилирование event loop (только для администратора)
+@logger.catch
+@app.get("/api/admin/profile", response_class=PlainTextResponse)
+async def profile(seconds: int = 10, admin_id: int = Depends(get_token_admin_id)):
+    """Снимает стеки event loop в течение seconds и отдает их в формате collapsed stacks для flamegraph"""
+    # Роль проверяется по JWT без сессии БД: профилирование не должно занимать соединение из пула
+    log.info(f"Профилирование event loop на {seconds}s (администратор {admin_id})")
+    try:
+        stacks = await profiler.profile(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        stacks,
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'},
+    )
+
+
+# Состояние event loop и пула БД (только для администратора)
+@logger.catch
+@app.get("/api/admin/diagnostics")
+async def diagnostics(admin_id: int = Depends(get_token_admin_id)):
+    return {
+        "loop_lag": loop_lag_monitor.lag,
+        "loop_max_lag": loop_lag_monitor.max_lag,
+        "slow_callbacks": loop_lag_monitor.slow_callbacks,
+        "db_pool_wait": pool_stats.wait,
+        "cold_start": getattr(app.state, "cold_start", None),
+    }
+
+
 ### --- РАСТЕНИЯ --- ###
 
 
@@ -184,45 +306,55 @@ async def create_user(user: UserCreateAdmin, db: AsyncSession = Depends(get_db))
 @app.get("/api/check_token")
 async def check_token():
     """Проверка токена на валидность"""
-    async with httpx.AsyncClient() as client:
-        try:
-            # Делаем запрос к Trefle API с переданным токеном
-            response = await client.get(TREFLE_API_URL, params={"token": TREFLE_API_KEY})
-
-            # Если статус ответа не 200, токен неверен
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Ошибка проверки токена: {
-                        response.status_code} - {response.text}"
-                )
+    try:
+        # Делаем запрос к Trefle API с переданным токеном (результат кэшируется)
+        status_code, text = await trefle_client.check_token()
+    except TrefleUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(trefle_client.breaker.retry_after()) + 1)},
+        )
+    except TrefleError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ошибка при подключении к Trefle API: {str(e)}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Неизвестная ошибка: {str(e)}"
+        )
 
-            # Если все хорошо, возвращаем успешный ответ
-            return {"message": f"Токен действителен", "status_code": response.status_code}
+    # Если статус ответа не 200, токен неверен
+    if status_code != 200:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ошибка проверки токена: {status_code} - {text}"
+        )
 
-        except httpx.HTTPStatusError as e:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Ошибка при подключении к Trefle API: {str(e)}"
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Неизвестная ошибка: {str(e)}"
-            )
+    # Если все хорошо, возвращаем успешный ответ
+    return {"message": f"Токен действителен", "status_code": status_code}
 
 
 # Загрузка растений с пагинацией
 @logger.catch
 @app.get("/api/plants")
 async def get_plants(
-    offset: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)
+    # Устаревший параметр: оставлен для уже установленных клиентов, новые листают по after_id
+    offset: int = Query(0, ge=0, deprecated=True),
+    limit: int = 10,
+    after_id: int | None = None,
+    db: AsyncSession = Depends(get_db),
 ):
-    """Загрузка растений с пагинацией"""
-    log.info(f"offset: {offset} limit: {limit}")
-    result = await db.execute(
-        select(Plant).order_by(Plant.id).offset(offset).limit(limit)
-    )
+    """Загрузка растений с пагинацией (after_id — id последнего растения предыдущей страницы).
+    Глубокий offset дорогой: каждая пропущенная строка читается с диска."""
+    log.info(f"offset: {offset} limit: {limit} after_id: {after_id}")
+    query = select(Plant).order_by(Plant.id)
+    if after_id is not None:
+        # Keyset-пагинация: идем по индексу с нужного id, не пропуская offset строк
+        query = query.where(Plant.id > after_id)
+    result = await db.execute(query.offset(offset).limit(limit))
     plants = result.scalars().all()
     return plants
 
@@ -230,182 +362,22 @@ async def get_plants(
 # Получение 5 случайных растений
 @logger.catch
 @app.get("/api/random_plants")
-async def get_random_plants(db: AsyncSession = Depends(get_db)):
-    """Получает случайные 5 растений с произвольной страницы API и сохраняет изображения локально"""
-    try:
-        async with httpx.AsyncClient() as client:
-            # Случайная страница
-            random_page = random.randint(1, 24468)
-
-            # Запрос данных с этой страницы
-            response = await client.get(
-                TREFLE_API_URL,
-                params={"page": random_page, "token": TREFLE_API_KEY},
-            )
-
-            if response.status_code != 200:
-                log.error(f"Ошибка API: {response.status_code}")
-                raise HTTPException(status_code=501, detail="Ошибка API")
-
-            plants_data = response.json().get("data", [])
-            added_plants = []
-            image_dir = Path("./image")
-            image_dir.mkdir(parents=True, exist_ok=True)
-
-            # Разделяем растения на две группы: с изображениями и без
-            plants_with_images = []
-            plants_without_images = []
-
-            for plant in plants_data:
-                # Проверяем наличие растения в базе
-                existing_plant = await db.execute(
-                    select(Plant).where(Plant.trefle_id == plant["id"])
-                )
-                if existing_plant.scalar_one_or_none():
-                    continue
-
-                # Разделяем растения в зависимости от наличия изображения
-                image_url = plant.get("image_url", "")
-                if image_url:
-                    plants_with_images.append(plant)
-                else:
-                    plants_without_images.append(plant)
-
-            # Сначала обрабатываем растения с изображениями
-            for plant in plants_with_images:
-                image_url = plant.get("image_url", "")
-                log.info(image_url)
-                local_image_path = ""
-
-                if image_url:
-                    image_name = f"{plant['id']}.jpg"
-                    local_image_path = image_dir / image_name
-
-                    try:
-                        headers = {
-                            "Accept": "image/jpeg",  # Указание, что хотим получить изображение
-                            "User-Agent": "Mozilla/5.0"
-                        }
-                        image_response = await client.get(image_url, headers=headers)
-
-                        # Логирование статуса и заголовков
-                        log.info(f"Попытка загрузки изображения {image_url} с статусом {image_response.status_code}")
-                        log.debug(f"Заголовки ответа: {image_response.headers}")
-
-                        content_type = image_response.headers.get(
-                            "Content-Type", "")
-                        log.debug(f"Content-Type: {content_type}")
-
-                        # Проверка контента и сохранение изображения, несмотря на octet-stream
-                        if image_response.status_code == 200:
-                            if "image" in content_type or "octet-stream" in content_type:
-                                with open(local_image_path, "wb") as img_file:
-                                    img_file.write(image_response.content)
-                                log.info(f"Изображение успешно сохранено: {local_image_path}")
-                            else:
-                                log.warning(f"Ошибка загрузки изображения {image_url}. Неверный Content-Type: {content_type}")
-                                continue
-                        else:
-                            log.warning(f"Ошибка загрузки изображения {image_url}. Статус: {image_response.status_code}")
-                    except httpx.RequestError as e:
-                        log.error(f"Ошибка при запросе изображения {image_url}: {e}")
-                    except Exception as e:
-                        log.error(f"Неизвестная ошибка при загрузке изображения {image_url}: {str(e)}")
-
-                # Создание нового растения с изображением
-                new_plant = Plant(
-                    trefle_id=plant["id"],
-                    scientific_name=plant["scientific_name"],
-                    common_name=plant.get(
-                        "common_name", "Неизвестно") or plant["scientific_name"],
-                    family=plant.get("family", "Неизвестно"),
-                    genus=plant.get("genus", "Неизвестно"),
-                    rank=plant.get("rank", "Неизвестно"),
-                    author=plant.get("author", "Неизвестно"),
-                    bibliography=plant.get("bibliography", "Неизвестно"),
-                    year=plant.get("year", 0),
-                    slug=plant["slug"],
-                    status=plant.get("status", "Неизвестно"),
-                    image_url=str(
-                        local_image_path) if local_image_path else "",
-                    plant_link=plant["links"].get("plant", ""),
-                    genus_link=plant["links"].get("genus", ""),
-                    self_link=plant["links"].get("self", ""),
-                )
-
-                # Сохраняем растение в БД
-                db.add(new_plant)
-                added_plants.append(new_plant)
-
-                if len(added_plants) >= 5:
-                    break
-
-            # Если нам нужно добавить еще растения без изображений
-            if len(added_plants) < 5:
-                for plant in plants_without_images:
-                    # Создание нового растения без изображения
-                    new_plant = Plant(
-                        trefle_id=plant["id"],
-                        scientific_name=plant["scientific_name"],
-                        common_name=plant.get(
-                            "common_name", "Неизвестно") or plant["scientific_name"],
-                        family=plant.get("family", "Неизвестно"),
-                        genus=plant.get("genus", "Неизвестно"),
-                        rank=plant.get("rank", "Неизвестно"),
-                        author=plant.get("author", "Неизвестно"),
-                        bibliography=plant.get("bibliography", "Неизвестно"),
-                        year=plant.get("year", 0),
-                        slug=plant["slug"],
-                        status=plant.get("status", "Неизвестно"),
-                        image_url="",  # Без изображения
-                        plant_link=plant["links"].get("plant", ""),
-                        genus_link=plant["links"].get("genus", ""),
-                        self_link=plant["links"].get("self", ""),
-                    )
-
-                    # Сохраняем растение в БД
-                    db.add(new_plant)
-                    added_plants.append(new_plant)
-
-                    if len(added_plants) >= 5:
-                        break
-
-            await db.commit()
-
-            # Преобразуем данные в тот же формат, что и в API пагинации
-            plants_response = [
-                {
-                    "id": plant.id,
-                    "scientific_name": plant.scientific_name,
-                    "common_name": plant.common_name,
-                    "family": plant.family,
-                    "genus": plant.genus,
-                    "rank": plant.rank,
-                    "author": plant.author,
-                    "bibliography": plant.bibliography,
-                    "year": plant.year,
-                    "slug": plant.slug,
-                    "status": plant.status,
-                    "image_url": plant.image_url,
-                    "plant_link": plant.plant_link,
-                    "genus_link": plant.genus_link,
-                    "self_link": plant.self_link,
-                }
-                for plant in added_plants
-            ]
-
-            return {
-                "page": random_page,
-                "message": "Растения успешно добавлены.",
-                "plants": plants_response,
-            }
-
-    except Exception as e:
-        log.error(f"Ошибка: {str(e)}")
+async def get_random_plants():
+    """Отдает 5 случайных растений из фонового буфера (растения уже сохранены в БД вместе с изображениями)"""
+    items = await plant_prefetcher.take(5)
+    if not items:
+        log.error("Буфер случайных растений пуст")
         raise HTTPException(
-            status_code=500, detail="Ошибка получения случайных растений"
+            status_code=503,
+            detail="Ошибка получения случайных растений",
+            headers={"Retry-After": "5"},
         )
 
+    return {
+        "page": items[0][0],
+        "message": "Растения успешно добавлены.",
+        "plants": [plant for _, plant in items],
+    }
 
 
 # Добавление растения в избранное
@@ -434,6 +406,7 @@ async def add_to_favorites(
     # Добавляем в избранное
     new_favorite = Favorite(user_id=current_user.id, plant_id=id)
     db.add(new_favorite)
+    await invalidation_bus.publish(db, "favorites_changed", ids=[id], user_id=current_user.id)
     await db.commit()
     return {"message": "Растение добавлено в избранное"}
 
@@ -459,6 +432,7 @@ async def remove_from_favorites(
 
     # Удаляем из избранного
     await db.delete(favorite)
+    await invalidation_bus.publish(db, "favorites_changed", ids=[id], user_id=current_user.id)
     await db.commit()
     return {"message": "Растение удалено из избранного"}
 
@@ -518,13 +492,79 @@ async def update_plant(
     for key, value in plant_data.dict(exclude_unset=True).items():
         setattr(plant, key, value)
 
-    # Сохраняем изменения
+    # Сохраняем изменения (ответ — только сообщение, refresh после commit не нужен)
+    await invalidation_bus.publish(db, "plant_updated", ids=[id])
     await db.commit()
-    await db.refresh(plant)
 
     return {"message": "Данные растения успешно обновлены"}
 
 
+# Пакетное обновление растений одной транзакцией (только для администратора)
+@logger.catch
+@app.patch("/api/plants/batch", response_model=dict)
+async def update_plants_batch(
+    plants_data: list[PlantBatchUpdate],
+    db: AsyncSession = Depends(get_db),
+    admin: User = Depends(get_current_admin),
+):
+    if len(plants_data) > MAX_PLANT_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Не больше {MAX_PLANT_BATCH} растений за запрос",
+        )
+
+    # Одним запросом узнаем, какие растения существуют, и блокируем их до commit,
+    # чтобы параллельное удаление не сделало результат "updated" ложным
+    ids = [plant_data.id for plant_data in plants_data]
+    result = await db.execute(select(Plant.id).where(Plant.id.in_(ids)).with_for_update())
+    existing_ids = set(result.scalars().all())
+
+    outcomes = {}
+    rows = []
+    for plant_data in plants_data:
+        if plant_data.id in outcomes:
+            outcomes[plant_data.id] = "duplicate"
+            continue
+        if plant_data.id not in existing_ids:
+            outcomes[plant_data.id] = "not_found"
+            continue
+        values = plant_data.dict(exclude_unset=True)
+        if len(values) == 1:
+            outcomes[plant_data.id] = "unchanged"
+            continue
+        outcomes[plant_data.id] = "updated"
+        rows.append(values)
+
+    # Повторяющиеся id не применяем вовсе, чтобы результат не зависел от порядка
+    rows = [row for row in rows if outcomes[row["id"]] == "updated"]
+    updated_ids = [row["id"] for row in rows]
+
+    if rows:
+        # Bulk UPDATE по первичному ключу: executemany, строки группируются по набору полей
+        try:
+            await db.execute(update(Plant), rows)
+            await invalidation_bus.publish(db, "plant_updated", ids=updated_ids)
+            await db.commit()
+        except IntegrityError as e:
+            await db.rollback()
+            log.warning(f"Ошибка пакетного обновления растений: {e.orig}")
+            # 23505 — unique_violation; остальные нарушения (NOT NULL, CHECK) — ошибка данных запроса
+            if getattr(e.orig, "sqlstate", None) == "23505":
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Нарушено ограничение уникальности, изменения не применены",
+                )
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Недопустимые значения полей, изменения не применены",
+            )
+
+    return {
+        "message": f"Обновлено растений: {len(updated_ids)}",
+        "results": [{"id": plant_id, "status": outcome} for plant_id, outcome in outcomes.items()],
+    }
+
+
 # Удаление растения по его ID с удалением связанного изображения
 @logger.catch
 @app.delete("/api/plants/{plant_id}", response_model=dict)
@@ -552,6 +592,7 @@ async def delete_plant(
 
     # Удаляем растение
     await db.delete(plant)
+    await invalidation_bus.publish(db, "plant_deleted", ids=[plant_id])
     await db.commit()
 
     return {"message": f"Растение с ID {plant_id} и его изображение удалено"}
@@ -580,6 +621,7 @@ async def delete_all_plants(
             
     # Удаление всех растений
     await db.execute(delete(Plant))
+    await invalidation_bus.publish(db, "plants_cleared")
     await db.commit()
 
     return {"message": "Все растения и их изображения удалены"}
@@ -589,14 +631,58 @@ async def delete_all_plants(
 @logger.catch
 @app.get("/api/image/{image_name}")
 async def get_image(image_name: str):
-    # Исправил на правильный путь к папке изображений
-    image_path = os.path.join("image", image_name)
-    log.info(f"Пытаемся вернуть изображение: {image_path}")
-
-    if os.path.exists(image_path):
-        # Возвращаем файл с правильным типом контента
-        # Задайте нужный тип изображения, например "image/jpeg" или "image/png"
-        return FileResponse(image_path, media_type="image/jpeg")
-    else:
+    # Пропускаем только имя файла без каталогов, чтобы нельзя было выйти за пределы папки изображений
+    if not IMAGE_NAME_RE.fullmatch(image_name):
+        raise HTTPException(status_code=400, detail="Некорректное имя изображения")
+
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL}
+    if IMAGE_DELIVERY == "accel":
+        # Файл отдаст nginx через sendfile, наличие файла тоже проверит он
+        headers["X-Accel-Redirect"] = f"{IMAGE_ACCEL_PREFIX}{image_name}"
+        return Response(headers=headers, media_type="image/jpeg")
+
+    image_path = os.path.join(IMAGE_DIR, image_name)
+    if not await asyncio.to_thread(os.path.isfile, image_path):
         # Если файл не найден, выбрасываем HTTPException с кодом 404
         raise HTTPException(status_code=404, detail="Image not found")
+
+    return FileResponse(image_path, media_type="image/jpeg", headers=headers)
+
+
+# Лента изменений каталога и избранного (Server-Sent Events) вместо опроса /api/plants и /api/favorites
+@app.get("/api/events")
+async def events(request: Request, user_id: int = Depends(get_token_user_id)):
+    # Пользователь берется из JWT без сессии БД: соединение живет долго и не должно занимать пул
+    if event_fanout.full():
+        raise HTTPException(
+            status_code=503,
+            detail="Слишком много подписчиков, повторите позже",
+            headers={"Retry-After": "30"},
+        )
+
+    async def stream():
+        yield f"retry: {EVENTS_KEEPALIVE * 1000}\n\n"
+        # Подписываемся внутри генератора: если ответ так и не начнет отправляться, подписчик не утечет
+        subscriber = event_fanout.subscribe(user_id)
+        if subscriber is None:
+            # Места заняли, пока отправлялись заголовки: клиент переподключится через retry
+            return
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is CLOSE_EVENT:
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            event_fanout.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering отключает буферизацию ответа в nginx
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Переменные окружения из .env загружаются один раз, при первом импорте пакета models
+load_dotenv()
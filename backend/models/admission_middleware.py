@@ -0,0 +1,168 @@
+import ipaddress
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from models.database import pool_stats
+from models.diagnostics import loop_lag_monitor
+from models.logger_config import setup_logger
+from models.token import ALGORITHM, SECRET_KEY
+
+logger = setup_logger()
+
+# Token bucket на пользователя/IP: запросов в секунду и размер всплеска
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "10"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "30"))
+ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+# Адреса прокси (nginx), которым доверяем заголовок X-Real-IP; остальным он не верится
+ADMISSION_TRUSTED_PROXIES = [
+    ipaddress.ip_network(address.strip())
+    for address in os.getenv("ADMISSION_TRUSTED_PROXIES", "127.0.0.1").split(",")
+    if address.strip()
+]
+
+# Дешевые пути без ограничения частоты: изображения (в режиме accel их отдает nginx;
+# Image.network во Flutter шлет их без токена, то есть по IP, а за NAT это общий bucket) и проверки живости
+RATE_LIMIT_EXEMPT_PATHS = {"/", "/healthz", "/readyz"}
+RATE_LIMIT_EXEMPT_PREFIXES = ("/api/image/",)
+
+# Отбрасывание дорогих запросов (лимиты маршрутов и пороги перегрузки); 0 — выключено
+ADMISSION_SHEDDING = os.getenv("ADMISSION_SHEDDING", "1") != "0"
+# Пороги перегрузки, после которых отбрасываются дорогие запросы
+ADMISSION_MAX_LOOP_LAG = float(os.getenv("ADMISSION_MAX_LOOP_LAG", "0.2"))
+ADMISSION_MAX_POOL_WAIT = float(os.getenv("ADMISSION_MAX_POOL_WAIT", "0.5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+# Дорогие эндпоинты (bcrypt, Trefle) и их лимиты одновременных запросов.
+# Они же считаются низкоприоритетными и отбрасываются первыми при перегрузке.
+ROUTE_LIMITS = {
+    "/api/login": 8,
+    "/token": 8,
+    "/api/register": 4,
+    "/api/admin/create": 4,
+    "/api/random_plants": 16,
+    "/api/check_token": 4,
+}
+# Переопределение лимитов из окружения: ADMISSION_ROUTE_LIMITS="/api/register=8,/api/login=16"
+for item in filter(None, os.getenv("ADMISSION_ROUTE_LIMITS", "").split(",")):
+    route, limit = item.split("=")
+    ROUTE_LIMITS[route.strip()] = int(limit)
+
+
+# Token bucket для одного клиента
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self) -> float:
+        """Списывает токен; возвращает 0 или сколько секунд ждать следующего"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+# Middleware для ограничения нагрузки и отбрасывания запросов при перегрузке
+class AdmissionMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, route_limits: dict[str, int] = ROUTE_LIMITS):
+        super().__init__(app)
+        self.route_limits = route_limits
+        self.active = {path: 0 for path in route_limits}
+        self.buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def client_key(self, request: Request) -> str:
+        """Ключ клиента: id пользователя из JWT или IP (nginx передает X-Real-IP)"""
+        authorization = request.headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            try:
+                # Проверяем подпись (один HMAC), иначе поддельный sub дает каждому запросу новый bucket
+                sub = jwt.decode(authorization[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+                if sub:
+                    return f"user:{sub}"
+            except JWTError:
+                pass
+        return f"ip:{self.client_ip(request)}"
+
+    def client_ip(self, request: Request) -> str:
+        """IP клиента: X-Real-IP принимаем только от доверенного прокси"""
+        peer = request.client.host if request.client else None
+        if peer is None:
+            return "unknown"
+        try:
+            trusted = any(ipaddress.ip_address(peer) in network for network in ADMISSION_TRUSTED_PROXIES)
+        except ValueError:
+            trusted = False
+        if trusted:
+            return request.headers.get("X-Real-IP") or peer
+        return peer
+
+    def bucket(self, key: str) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(ADMISSION_RATE, ADMISSION_BURST)
+            # Ограничиваем память: выкидываем давно не приходивших клиентов
+            if len(self.buckets) > ADMISSION_MAX_CLIENTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def overloaded(self) -> str | None:
+        if loop_lag_monitor.lag > ADMISSION_MAX_LOOP_LAG:
+            return f"loop lag {loop_lag_monitor.lag:.3f}s"
+        if pool_stats.wait > ADMISSION_MAX_POOL_WAIT:
+            return f"db pool wait {pool_stats.wait:.3f}s"
+        return None
+
+    def reject(self, status_code: int, detail: str, retry_after: float) -> JSONResponse:
+        return JSONResponse(
+            status_code=status_code,
+            content={"detail": detail},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    async def dispatch(self, request: Request, call_next):
+        path = request.url.path
+
+        if path in RATE_LIMIT_EXEMPT_PATHS or path.startswith(RATE_LIMIT_EXEMPT_PREFIXES):
+            return await call_next(request)
+
+        # Ограничение частоты запросов клиента
+        key = self.client_key(request)
+        wait = self.bucket(key).consume()
+        if wait:
+            logger.warning(f"Превышен лимит запросов: {key} {request.method} {path}")
+            return self.reject(429, "Слишком много запросов", wait)
+
+        limit = self.route_limits.get(path)
+        if limit is None or not ADMISSION_SHEDDING:
+            # Чтение каталога не отбрасываем
+            return await call_next(request)
+
+        # Дорогие запросы отбрасываем при перегрузке event loop или пула БД
+        reason = self.overloaded()
+        if reason:
+            logger.warning(f"Запрос {request.method} {path} отброшен: {reason}")
+            return self.reject(503, "Сервер перегружен, повторите позже", ADMISSION_RETRY_AFTER)
+
+        if self.active[path] >= limit:
+            logger.warning(f"Запрос {request.method} {path} отброшен: достигнут лимит {limit}")
+            return self.reject(503, "Сервер перегружен, повторите позже", ADMISSION_RETRY_AFTER)
+
+        self.active[path] += 1
+        try:
+            return await call_next(request)
+        finally:
+            self.active[path] -= 1
@@ -1,13 +1,14 @@
+import asyncio
+import json
 import os
+import time
+import psycopg
+from loguru import logger
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from models.models import Base
-from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
-
 # Строка подключения к базе данных из .env
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -22,16 +23,132 @@ AsyncSessionLocal = sessionmaker(
 )
 
 
-# Создание таблиц и начальной записи (root user)
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+# Статистика ожидания соединения из пула (для admission control).
+# Оценка затухает со временем: без новых замеров (например, когда дорогие запросы
+# отбрасываются до get_db) она не должна навсегда остаться высокой.
+class PoolStats:
+    def __init__(self, smoothing: float = 0.2, half_life: float = 5.0):
+        self.smoothing = smoothing
+        self.half_life = half_life  # за сколько секунд без замеров оценка падает вдвое
+        self._wait = 0.0
+        self._updated = time.monotonic()
+
+    @property
+    def wait(self) -> float:
+        """Сглаженное время ожидания, секунды"""
+        age = time.monotonic() - self._updated
+        return self._wait * 0.5 ** (age / self.half_life)
+
+    def record(self, wait: float):
+        current = self.wait
+        self._wait = current + self.smoothing * (wait - current)
+        self._updated = time.monotonic()
+
+
+pool_stats = PoolStats()
+
+
+# Проверка соединения с БД одним запросом
+async def ping_db():
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+# Прогрев пула: открываем соединения заранее, чтобы первые запросы не ждали подключения
+async def warm_pool():
+    await asyncio.gather(*(ping_db() for _ in range(engine.pool.size())))
 
 
 # Получение сессии
 async def get_db():
     session = AsyncSessionLocal()
     try:
+        # Берем соединение сразу, чтобы замерить ожидание пула
+        start = time.monotonic()
+        await session.connection()
+        pool_stats.record(time.monotonic() - start)
         yield session  # Возвращаем сессию
     finally:
         await session.close()  # Закрываем сессию
+
+
+### --- ШИНА ИНВАЛИДАЦИИ КЭШЕЙ --- ###
+
+
+# Канал PostgreSQL для событий об изменении данных
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+# Пауза перед переподключением LISTEN соединения
+INVALIDATION_RECONNECT_DELAY = float(os.getenv("INVALIDATION_RECONNECT_DELAY", "2"))
+# Лимит payload у NOTIFY — 8000 байт, длинные списки id заменяем на "все"
+MAX_NOTIFY_PAYLOAD = 7900
+
+
+# Шина инвалидации кэшей между воркерами через LISTEN/NOTIFY
+class InvalidationBus:
+    def __init__(self, channel: str = INVALIDATION_CHANNEL):
+        self.channel = channel
+        self.handlers = []
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, handler):
+        """Регистрация обработчика событий: handler(event: dict)"""
+        self.handlers.append(handler)
+
+    async def publish(self, db: AsyncSession, event_type: str, ids: list[int] | None = None, **data):
+        """Добавляет NOTIFY в текущую транзакцию: событие уйдет только после commit"""
+        event = {"type": event_type, "ids": ids, **data}
+        payload = json.dumps(event)
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            event["ids"] = None
+            payload = json.dumps(event)
+        await db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": self.channel, "payload": payload},
+        )
+
+    def dispatch(self, event: dict):
+        for handler in self.handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика инвалидации {event.get('type')}: {e}")
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        # Отдельное соединение psycopg (не из пула SQLAlchemy) под LISTEN
+        conninfo = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+                    await conn.execute(f'LISTEN "{self.channel}"')
+                    logger.info(f"Подписка на канал инвалидации {self.channel}")
+                    # Пока соединения не было, события могли потеряться — сбрасываем кэши целиком
+                    self.dispatch({"type": "reset", "ids": None})
+                    async for notify in conn.notifies():
+                        try:
+                            event = json.loads(notify.payload)
+                        except ValueError:
+                            logger.warning(f"Некорректное событие инвалидации: {notify.payload}")
+                            continue
+                        self.dispatch(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Соединение LISTEN потеряно: {e}")
+            await asyncio.sleep(INVALIDATION_RECONNECT_DELAY)
+
+
+# Общая шина для приложения
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from loguru import logger
+
+# Период замера задержки event loop
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+# Сколько event loop может не отвечать, прежде чем мы залогируем стек
+SLOW_CALLBACK_THRESHOLD = float(os.getenv("SLOW_CALLBACK_THRESHOLD", "0.25"))
+# Ограничения профилировщика
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Каталог backend: по нему отличаем код приложения от библиотек
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Ближайший к вершине стека кадр из кода приложения (обработчик, который блокирует loop)
+def _app_frame(frame) -> str:
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and "site-packages" not in filename:
+            return f"{frame.f_code.co_name} ({os.path.relpath(filename, APP_DIR)}:{frame.f_lineno})"
+        frame = frame.f_back
+    return "неизвестно"
+
+
+# Стек в формате collapsed stacks (корень первым, кадры через ";")
+def _collapse(frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+# Замер задержки event loop: насколько позже запланированного просыпается таймер.
+# Отдельный поток-сторож логирует стек loop, если тот завис дольше порога.
+class LoopLagMonitor:
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        slow_threshold: float = SLOW_CALLBACK_THRESHOLD,
+        smoothing: float = 0.2,
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.smoothing = smoothing
+        self.lag = 0.0  # сглаженная задержка, секунды
+        self.max_lag = 0.0  # максимальная задержка с момента запуска
+        self.slow_callbacks = 0
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def record(self, lag: float):
+        self.lag += self.smoothing * (lag - self.lag)
+        self.max_lag = max(self.max_lag, lag)
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.heartbeat = time.monotonic()
+            self.record(max(0.0, self.heartbeat - start - self.interval))
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self.heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            # Одно зависание логируем один раз
+            if stalled < self.slow_threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            self.slow_callbacks += 1
+            logger.warning(
+                f"Event loop заблокирован {stalled:.3f}s в {_app_frame(frame)}\n"
+                + "".join(traceback.format_stack(frame))
+            )
+
+
+# Статистический профилировщик: периодически снимает стек потока event loop
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, thread_id: int, seconds: float) -> str:
+        """Снимает стеки потока thread_id в течение seconds (блокирующий, запускать в отдельном потоке)"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже запущено")
+        try:
+            counts = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(thread_id)
+                if frame is not None:
+                    counts[_collapse(frame)] += 1
+                del frame
+                time.sleep(self.interval)
+        finally:
+            self._lock.release()
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+    async def profile(self, seconds: float) -> str:
+        """Профилирует event loop, из которого вызван, не блокируя его"""
+        seconds = min(max(seconds, 1), PROFILE_MAX_SECONDS)
+        return await asyncio.to_thread(self.sample, threading.get_ident(), seconds)
+
+
+# Общие экземпляры для приложения
+loop_lag_monitor = LoopLagMonitor()
+profiler = SamplingProfiler()
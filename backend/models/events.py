@@ -0,0 +1,126 @@
+import asyncio
+import os
+import signal
+
+from loguru import logger
+
+from models.database import invalidation_bus
+
+# Размер буфера событий одного подписчика
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "100"))
+# Максимум одновременных подписчиков на воркер
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000"))
+
+# События шины, которые уходят всем подписчикам
+PLANT_EVENTS = ("plant_added", "plant_updated", "plant_deleted", "plants_cleared")
+# Сигнал завершения ленты (остановка сервера); клиенту не отправляется
+CLOSE_EVENT = {"type": "close"}
+
+
+# Подписчик ленты изменений: свой ограниченный буфер событий
+class Subscriber:
+    def __init__(self, user_id: int, buffer_size: int = EVENTS_BUFFER_SIZE):
+        self.user_id = user_id
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=buffer_size)
+        self.closed = False
+
+    def push(self, event: dict):
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать: выбрасываем накопленное и просим перезагрузить данные целиком
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self):
+        """Завершение ленты: сигнал закрытия кладется даже в переполненный буфер"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(CLOSE_EVENT)
+
+
+# Рассылка изменений каталога и избранного подписчикам внутри процесса.
+# Источник событий — шина инвалидации, поэтому подписчики видят изменения со всех воркеров.
+class EventFanout:
+    def __init__(self, max_subscribers: int = EVENTS_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscribers: set[Subscriber] = set()
+        self.closed = False
+
+    def full(self) -> bool:
+        return self.closed or len(self.subscribers) >= self.max_subscribers
+
+    def subscribe(self, user_id: int) -> Subscriber | None:
+        if self.full():
+            return None
+        subscriber = Subscriber(user_id)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def close(self):
+        """Завершение всех лент при остановке сервера, чтобы открытые SSE не держали shutdown"""
+        self.closed = True
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+
+    def close_on_exit_signals(self):
+        """Закрывать ленты сразу по SIGTERM/SIGINT.
+
+        uvicorn вызывает lifespan shutdown только после того, как закроются все соединения,
+        поэтому из shutdown_event ленты закрывать поздно. Обработчик uvicorn вызывается следом.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.close)
+                if callable(previous):
+                    previous(signum, frame)
+                elif previous == signal.SIG_DFL:
+                    signal.signal(signum, signal.SIG_DFL)
+                    signal.raise_signal(signum)
+
+            try:
+                signal.signal(sig, handler)
+            except ValueError:
+                # Не главный поток (например, приложение запущено внутри другого процесса-хоста)
+                logger.warning("Обработчик сигналов для ленты событий не установлен: не главный поток")
+                return
+
+    def handle_invalidation(self, event: dict):
+        """Обработчик шины инвалидации: превращает событие в компактное уведомление"""
+        event_type = event["type"]
+        if event_type == "reset":
+            # События могли потеряться, пока шина переподключалась
+            self.broadcast({"type": "resync"})
+        elif event_type in PLANT_EVENTS:
+            if event.get("ids") is None and event_type != "plants_cleared":
+                self.broadcast({"type": "resync"})
+            else:
+                self.broadcast({"type": event_type, "ids": event.get("ids")})
+        elif event_type == "favorites_changed":
+            notification = {"type": "favorite_toggled", "ids": event.get("ids")}
+            for subscriber in list(self.subscribers):
+                if subscriber.user_id == event.get("user_id"):
+                    subscriber.push(notification)
+
+    def broadcast(self, notification: dict):
+        for subscriber in list(self.subscribers):
+            subscriber.push(notification)
+        logger.debug(f"Событие {notification['type']} отправлено {len(self.subscribers)} подписчикам")
+
+
+# Общая рассылка для приложения
+event_fanout = EventFanout()
+invalidation_bus.subscribe(event_fanout.handle_invalidation)
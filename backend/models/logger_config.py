@@ -1,11 +1,16 @@
 import os
 import sys
 from loguru import logger
-from dotenv import load_dotenv
 
-load_dotenv()
+# Логгер настраивается один раз на процесс, повторные вызовы возвращают готовый
+_configured = False
+
 
 def setup_logger():
+    global _configured
+    if _configured:
+        return logger
+
     log_file_name = os.getenv("LOG_FILE_NAME", "app.log")
     rotation_size = os.getenv("LOG_ROTATION_SIZE", "50 MB")
     level = os.getenv("LOG_LEVEL", "INFO")
@@ -29,4 +34,5 @@ def setup_logger():
         level=level
     )
     logger.add(sys.stderr, format=log_format, level="ERROR")
+    _configured = True
     return logger
@@ -0,0 +1,126 @@
+import asyncio
+
+from loguru import logger
+from sqlalchemy import text
+
+from models.database import engine
+
+# Ключ advisory lock, чтобы миграции не запустились параллельно
+MIGRATIONS_LOCK_ID = 7420311
+
+
+# Исходная схема: таблицы, которые раньше создавал create_all при старте, зафиксированные явным DDL.
+# Миграции не зависят от текущих моделей, поэтому версия означает одну и ту же схему на любой базе.
+# IF NOT EXISTS: на старых базах, созданных через create_all, существующие объекты не трогаются.
+INITIAL_SCHEMA = (
+    """
+    DO $$ BEGIN
+        CREATE TYPE userrole AS ENUM ('admin', 'user');
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(50) NOT NULL UNIQUE,
+        password VARCHAR(255) NOT NULL,
+        role userrole
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+    """
+    CREATE TABLE IF NOT EXISTS plants (
+        id SERIAL PRIMARY KEY,
+        trefle_id INTEGER NOT NULL UNIQUE,
+        scientific_name VARCHAR(255) NOT NULL,
+        common_name VARCHAR(255),
+        family VARCHAR(255),
+        genus VARCHAR(255),
+        genus_id INTEGER,
+        rank VARCHAR(100),
+        author VARCHAR(255),
+        bibliography TEXT,
+        year INTEGER,
+        slug VARCHAR(255) NOT NULL UNIQUE,
+        status VARCHAR(100),
+        image_url TEXT,
+        plant_link TEXT,
+        genus_link TEXT,
+        self_link TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_plants_id ON plants (id)",
+    """
+    CREATE TABLE IF NOT EXISTS favorites (
+        user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        plant_id INTEGER NOT NULL REFERENCES plants (id) ON DELETE CASCADE,
+        PRIMARY KEY (user_id, plant_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS refresh_tokens (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        token_hash VARCHAR(64) NOT NULL UNIQUE,
+        expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        revoked BOOLEAN NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_id ON refresh_tokens (id)",
+    "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id ON refresh_tokens (user_id)",
+)
+
+
+# Версионированные миграции: (версия, описание, SQL или кортеж SQL-операторов).
+# Применённые миграции не меняем — изменения схемы только новой версией.
+MIGRATIONS = [
+    (1, "Исходная схема", INITIAL_SCHEMA),
+    (2, "Индекс favorites.plant_id", "CREATE INDEX IF NOT EXISTS ix_favorites_plant_id ON favorites (plant_id)"),
+]
+
+# Версия схемы, которую ожидает код приложения
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(conn) -> int:
+    exists = await conn.scalar(text("SELECT to_regclass('schema_migrations') IS NOT NULL"))
+    if not exists:
+        return 0
+    return await conn.scalar(text("SELECT coalesce(max(version), 0) FROM schema_migrations"))
+
+
+# Применение недостающих миграций (запускается отдельно от воркеров: python -m models.migrations)
+async def migrate():
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATIONS_LOCK_ID})
+        await conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+        current = await get_schema_version(conn)
+        for version, description, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"Миграция {version}: {description}")
+            statements = (migration,) if isinstance(migration, str) else migration
+            for statement in statements:
+                await conn.execute(text(statement))
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                {"version": version, "description": description},
+            )
+        logger.info(f"Схема БД в версии {SCHEMA_VERSION}")
+
+
+# Проверка при старте воркера: схема должна быть не старее кода
+async def check_schema():
+    async with engine.connect() as conn:
+        version = await get_schema_version(conn)
+    if version < SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Схема БД в версии {version}, нужна {SCHEMA_VERSION}: запустите python -m models.migrations"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
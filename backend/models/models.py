@@ -1,14 +1,19 @@
-from sqlalchemy import Column, Integer, String, Text, Enum, ForeignKey
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, Text, Enum, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from passlib.context import CryptContext
-from pydantic import BaseModel
+from functools import lru_cache
+from pydantic import BaseModel, field_validator
 from typing import Optional
 import enum
 
 Base = declarative_base()
-# Инициализация bcrypt контекста для хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+# Контекст bcrypt для хеширования паролей: один на процесс, создается при первом обращении
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 # Модель для ответа с токеном
@@ -17,6 +22,11 @@ class TokenResponse(BaseModel):
     token_type: str
 
 
+# Модель запроса с refresh токеном
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 # Pydantic-модель для регистрации
 class UserCreate(BaseModel):
     username: str
@@ -73,6 +83,19 @@ class PlantUpdate(BaseModel):
     image_url: Optional[str] = None
 
 
+# Pydantic модель для пакетного обновления: изменения одного растения по id
+class PlantBatchUpdate(PlantUpdate):
+    id: int
+
+    # Эти поля в таблице NOT NULL: явный null отклоняем сразу, а не ошибкой БД на весь пакет
+    @field_validator("scientific_name", "slug")
+    @classmethod
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("поле не может быть null")
+        return value
+
+
 # Таблица растений
 class Plant(Base):
     __tablename__ = "plants"
@@ -111,11 +134,11 @@ class User(Base):
 
     def verify_password(self, password: str) -> bool:
         """Проверка пароля"""
-        return pwd_context.verify(password, self.password)
+        return get_pwd_context().verify(password, self.password)
 
     def set_password(self, password: str):
         """Хеширование пароля"""
-        self.password = pwd_context.hash(password)
+        self.password = get_pwd_context().hash(password)
 
 
 # Таблица избранного
@@ -123,10 +146,24 @@ class Favorite(Base):
     __tablename__ = "favorites"
     
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
-    plant_id = Column(Integer, ForeignKey("plants.id", ondelete="CASCADE"), primary_key=True)
+    plant_id = Column(Integer, ForeignKey("plants.id", ondelete="CASCADE"), primary_key=True, index=True)
 
     # Связь с растениями
     plant = relationship("Plant", back_populates="favorites")
 
     # Связь с пользователями
-    user = relationship("User", back_populates="favorites")
\ No newline at end of file
+    user = relationship("User", back_populates="favorites")
+
+
+# Таблица refresh токенов (храним только sha256 от токена)
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked = Column(Boolean, default=False, nullable=False)
+
+    # Связь с пользователем
+    user = relationship("User")
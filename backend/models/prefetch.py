@@ -0,0 +1,263 @@
+import asyncio
+import os
+import random
+from collections import deque
+from pathlib import Path
+
+from loguru import logger
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+
+from models.database import AsyncSessionLocal, invalidation_bus
+from models.models import Plant
+from models.trefle import TrefleClient, TrefleError, TrefleUnavailable, trefle_client
+
+# Границы буфера готовых растений
+PREFETCH_LOW_WATERMARK = int(os.getenv("PREFETCH_LOW_WATERMARK", "10"))
+PREFETCH_HIGH_WATERMARK = int(os.getenv("PREFETCH_HIGH_WATERMARK", "50"))
+# Сколько запрос ждет пополнения пустого буфера
+PREFETCH_WAIT_TIMEOUT = float(os.getenv("PREFETCH_WAIT_TIMEOUT", "10"))
+# Пауза после ошибки пополнения
+PREFETCH_ERROR_DELAY = float(os.getenv("PREFETCH_ERROR_DELAY", "5"))
+
+# Количество страниц в Trefle API
+TREFLE_PAGES = 24468
+
+
+# Преобразование растения в формат ответа API
+def plant_to_dict(plant: Plant) -> dict:
+    return {
+        "id": plant.id,
+        "scientific_name": plant.scientific_name,
+        "common_name": plant.common_name,
+        "family": plant.family,
+        "genus": plant.genus,
+        "rank": plant.rank,
+        "author": plant.author,
+        "bibliography": plant.bibliography,
+        "year": plant.year,
+        "slug": plant.slug,
+        "status": plant.status,
+        "image_url": plant.image_url,
+        "plant_link": plant.plant_link,
+        "genus_link": plant.genus_link,
+        "self_link": plant.self_link,
+    }
+
+
+# Сохранение изображения на диск
+def _save_image(path: Path, content: bytes):
+    with open(path, "wb") as img_file:
+        img_file.write(content)
+
+
+# Фоновый буфер случайных растений, уже сохраненных в БД вместе с изображениями
+class PlantPrefetcher:
+    def __init__(
+        self,
+        client: TrefleClient = trefle_client,
+        low_watermark: int = PREFETCH_LOW_WATERMARK,
+        high_watermark: int = PREFETCH_HIGH_WATERMARK,
+        image_dir: str = "image",
+    ):
+        self.client = client
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.image_dir = Path(image_dir)
+        self.buffer: deque[tuple[int, dict]] = deque()
+        self._wakeup = asyncio.Event()
+        self._refilled = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._reload_task: asyncio.Task | None = None
+        # Меняется при очистке буфера: текущее пополнение после нее прекращается
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def start(self):
+        """Запуск фонового пополнения (вызывается в startup_event)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    async def stop(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def pop(self, count: int) -> list[tuple[int, dict]]:
+        """Забрать до count растений из буфера без ожидания"""
+        items = [self.buffer.popleft() for _ in range(min(count, len(self.buffer)))]
+        if len(self.buffer) < self.low_watermark:
+            self._wakeup.set()
+        return items
+
+    async def take(self, count: int, timeout: float = PREFETCH_WAIT_TIMEOUT) -> list[tuple[int, dict]]:
+        """Забрать count растений, при нехватке дождаться пополнения"""
+        items = self.pop(count)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(items) < count and self._task is not None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            # Все ожидающие запросы ждут одно и то же пополнение
+            refilled = self._refilled
+            try:
+                await asyncio.wait_for(refilled.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+            items.extend(self.pop(count - len(items)))
+        return items
+
+    def discard(self, plant_ids: set[int]):
+        """Убрать из буфера удаленные растения"""
+        self.buffer = deque(item for item in self.buffer if item[1]["id"] not in plant_ids)
+
+    def clear(self):
+        """Очистка буфера; заново он пополнится только по запросу из take()"""
+        self.buffer.clear()
+        self._generation += 1
+
+    def handle_invalidation(self, event: dict):
+        """Обработчик шины инвалидации: выкидываем измененные и удаленные растения"""
+        event_type = event["type"]
+        if event_type == "plants_cleared":
+            self.clear()
+        elif event_type == "reset" or (event_type in ("plant_updated", "plant_deleted") and event.get("ids") is None):
+            # Какие растения изменились, неизвестно. Растения из буфера уже сохранены в каталоге,
+            # поэтому не выбрасываем их (иначе пополнение добавит в каталог новые), а перечитываем из БД
+            if self._reload_task is None or self._reload_task.done():
+                self._reload_task = asyncio.create_task(self._reload())
+        elif event_type in ("plant_updated", "plant_deleted"):
+            self.discard(set(event["ids"]))
+
+    async def _reload(self):
+        """Перечитать растения буфера из БД: удаленные убрать, измененные обновить"""
+        ids = [item[1]["id"] for item in self.buffer]
+        if not ids:
+            return
+        try:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(Plant).where(Plant.id.in_(ids)))
+                plants = {plant.id: plant_to_dict(plant) for plant in result.scalars().all()}
+        except Exception as e:
+            logger.error(f"Ошибка проверки буфера растений: {e}")
+            self.buffer.clear()
+            return
+        # Пока шел запрос, буфер мог измениться: новые растения оставляем как есть
+        checked = set(ids)
+        self.buffer = deque(
+            (page, plants[plant["id"]] if plant["id"] in checked else plant)
+            for page, plant in self.buffer
+            if plant["id"] in plants or plant["id"] not in checked
+        )
+
+    def _notify_refilled(self):
+        self._refilled.set()
+        self._refilled = asyncio.Event()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            generation = self._generation
+            while len(self.buffer) < self.high_watermark and self._generation == generation:
+                try:
+                    await self._ingest_page(random.randint(1, TREFLE_PAGES))
+                except TrefleUnavailable:
+                    await asyncio.sleep(self.client.breaker.retry_after() + 1)
+                except Exception as e:
+                    logger.error(f"Ошибка пополнения буфера растений: {e}")
+                    await asyncio.sleep(PREFETCH_ERROR_DELAY)
+                finally:
+                    self._notify_refilled()
+
+    async def _download(self, plant: dict) -> dict | None:
+        image_url = plant["image_url"]
+        local_image_path = self.image_dir / f"{plant['id']}.jpg"
+        try:
+            image_response = await self.client.download_image(image_url)
+        except TrefleError as e:
+            logger.error(f"Ошибка при запросе изображения {image_url}: {e}")
+            return None
+
+        content_type = image_response.headers.get("Content-Type", "")
+        if image_response.status_code != 200:
+            logger.warning(f"Ошибка загрузки изображения {image_url}. Статус: {image_response.status_code}")
+            return None
+        # Сохраняем изображение, несмотря на octet-stream
+        if "image" not in content_type and "octet-stream" not in content_type:
+            logger.warning(f"Ошибка загрузки изображения {image_url}. Неверный Content-Type: {content_type}")
+            return None
+
+        await asyncio.to_thread(_save_image, local_image_path, image_response.content)
+        return {
+            "trefle_id": plant["id"],
+            "scientific_name": plant["scientific_name"],
+            "common_name": plant.get("common_name", "Неизвестно") or plant["scientific_name"],
+            "family": plant.get("family", "Неизвестно"),
+            "genus": plant.get("genus", "Неизвестно"),
+            "rank": plant.get("rank", "Неизвестно"),
+            "author": plant.get("author", "Неизвестно"),
+            "bibliography": plant.get("bibliography", "Неизвестно"),
+            "year": plant.get("year", 0),
+            "slug": plant["slug"],
+            "status": plant.get("status", "Неизвестно"),
+            "image_url": str(local_image_path),
+            "plant_link": plant["links"].get("plant", ""),
+            "genus_link": plant["links"].get("genus", ""),
+            "self_link": plant["links"].get("self", ""),
+        }
+
+    async def _ingest_page(self, page: int) -> int:
+        """Загрузить страницу Trefle, сохранить новые растения с изображениями и положить их в буфер"""
+        page_data = await self.client.get_page(page)
+        plants_data = [plant for plant in page_data.get("data", []) if plant.get("image_url")]
+        if not plants_data:
+            return 0
+
+        # Одним запросом отсеиваем растения, которые уже есть в базе
+        async with AsyncSessionLocal() as db:
+            existing = await db.execute(
+                select(Plant.trefle_id).where(Plant.trefle_id.in_([plant["id"] for plant in plants_data]))
+            )
+            existing_ids = set(existing.scalars().all())
+        plants_data = [plant for plant in plants_data if plant["id"] not in existing_ids]
+        if not plants_data:
+            return 0
+
+        # Изображения качаем без открытой сессии: загрузка может длиться десятки секунд
+        await asyncio.to_thread(self.image_dir.mkdir, parents=True, exist_ok=True)
+        rows = await asyncio.gather(*(self._download(plant) for plant in plants_data))
+        rows = [row for row in rows if row is not None]
+        if not rows:
+            return 0
+
+        async with AsyncSessionLocal() as db:
+            # Конфликты по trefle_id/slug с другими воркерами просто пропускаем
+            result = await db.execute(
+                insert(Plant).values(rows).on_conflict_do_nothing().returning(Plant)
+            )
+            added_plants = result.scalars().all()
+            if added_plants:
+                await invalidation_bus.publish(db, "plant_added", ids=[plant.id for plant in added_plants])
+            await db.commit()
+
+        for plant in added_plants:
+            self.buffer.append((page, plant_to_dict(plant)))
+        logger.info(f"Буфер растений пополнен на {len(added_plants)} (страница {page}), всего {len(self.buffer)}")
+        return len(added_plants)
+
+
+# Общий буфер для приложения
+plant_prefetcher = PlantPrefetcher()
+invalidation_bus.subscribe(plant_prefetcher.handle_invalidation)
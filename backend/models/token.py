@@ -1,31 +1,29 @@
+import asyncio
+import hashlib
 import os
+import secrets
 from datetime import datetime, timedelta
 from loguru import logger
 from fastapi import Depends, HTTPException, status, Form, APIRouter
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import delete, update
 from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
-from dotenv import load_dotenv
-from models.models import User
+from models.models import RefreshRequest, RefreshToken, User, UserRole, get_pwd_context
 from models.database import get_db
-from passlib.context import CryptContext
 from pydantic import BaseModel
 
-# Загрузка переменных окружения
-load_dotenv()
-
 # Переменные JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "default_secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 # Инструмент OAuth2 для Swagger
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Хэширование пароля
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Роутер для /token
 router = APIRouter()
 
@@ -34,6 +32,7 @@ router = APIRouter()
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 
 # Создание JWT токена с ролью пользователя
@@ -46,6 +45,26 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
+# Хэш refresh токена: токен случайный, поэтому достаточно sha256 вместо bcrypt
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# Создание refresh токена (сохраняется при commit вызывающего кода).
+# Заодно удаляем истекшие токены пользователя: отозванные храним до истечения ради обнаружения повторов.
+async def create_refresh_token(db: AsyncSession, user_id: int) -> str:
+    await db.execute(
+        delete(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.expires_at < datetime.utcnow())
+    )
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
 # Эндпоинт для генерации токена
 @router.post("/token", response_model=TokenResponse)
 async def login_for_access_token(
@@ -57,7 +76,8 @@ async def login_for_access_token(
     result = await db.execute(select(User).where(User.username == username))
     user = result.scalars().first()
 
-    if not user or not pwd_context.verify(password, user.password):
+    # bcrypt в потоке, чтобы не блокировать event loop
+    if not user or not await asyncio.to_thread(verify_password, password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -66,7 +86,70 @@ async def login_for_access_token(
 
     # Генерация JWT токена
     access_token = create_access_token(data={"sub": str(user.id), "role": user.role.value})
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = await create_refresh_token(db, user.id)
+    await db.commit()
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+# Обновление access токена по refresh токену (без bcrypt), refresh токен при этом меняется
+@router.post("/api/token/refresh")
+async def refresh_access_token(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    token_hash = hash_refresh_token(body.refresh_token)
+
+    # Каждое предъявление проверяется по БД: повтор отозванного токена на любом воркере
+    # должен отозвать все токены пользователя.
+    # Блокируем строку, чтобы один токен нельзя было обменять дважды параллельно
+    result = await db.execute(
+        select(RefreshToken)
+        .options(joinedload(RefreshToken.user, innerjoin=True))
+        .where(RefreshToken.token_hash == token_hash)
+        .with_for_update(of=RefreshToken)
+    )
+    stored = result.scalars().first()
+    if stored is None:
+        raise invalid
+
+    if stored.revoked:
+        # Повторное использование отозванного токена: похоже на кражу, отзываем все токены пользователя
+        logger.warning(f"Повторное использование refresh токена пользователя {stored.user_id}")
+        await db.execute(
+            update(RefreshToken).where(RefreshToken.user_id == stored.user_id).values(revoked=True)
+        )
+        await db.commit()
+        raise invalid
+
+    if stored.expires_at < datetime.utcnow():
+        raise invalid
+
+    # Ротация: старый токен отзываем, выдаем новый
+    stored.revoked = True
+    refresh_token = await create_refresh_token(db, stored.user_id)
+    await db.commit()
+
+    user = stored.user
+    access_token = create_access_token(data={"sub": str(user.id), "role": user.role.value})
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "role": user.role.value,
+    }
+
+
+# Отзыв refresh токена (выход из сессии)
+@router.post("/api/token/revoke")
+async def revoke_refresh_token(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    token_hash = hash_refresh_token(body.refresh_token)
+    await db.execute(
+        update(RefreshToken).where(RefreshToken.token_hash == token_hash).values(revoked=True)
+    )
+    await db.commit()
+    return {"message": "Refresh токен отозван"}
 
 
 # Проверка токена и получение текущего пользователя
@@ -107,17 +190,55 @@ async def get_current_user(
         )
 
 
+# id пользователя и роль из JWT без обращения к БД
+def decode_token_claims(token: str) -> tuple[int, str | None]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return int(payload["sub"]), payload.get("role")
+    except (JWTError, KeyError, ValueError) as e:
+        logger.error(f"Ошибка декодирования токена: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+# Проверка токена без обращения к БД: для долгих соединений, которые не должны держать сессию
+def get_token_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    user_id, _ = decode_token_claims(token)
+    return user_id
+
+
+# Проверка роли администратора по JWT без обращения к БД: для долгих запросов и диагностики,
+# которые не должны занимать соединение из пула
+def get_token_admin_id(token: str = Depends(oauth2_scheme)) -> int:
+    user_id, role = decode_token_claims(token)
+    if role != UserRole.admin.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Только администратор может выполнять данную операцию.",
+        )
+    return user_id
+
+
+# Проверка, что текущий пользователь — администратор
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role != UserRole.admin.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Только администратор может выполнять данную операцию.",
+        )
+    return current_user
+
+
 # Хэширование пароля
 def hash_password(password: str) -> str:
     """Хэширование пароля с использованием bcrypt."""
-    from passlib.context import CryptContext
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 # Проверка пароля
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Сравнение хэшированного и plain паролей."""
-    from passlib.context import CryptContext
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+import httpx
+from loguru import logger
+
+# Настройки Trefle API (URL можно переопределить для локального стаб-сервера)
+TREFLE_API_KEY = os.getenv("TREFLE_API_KEY")
+TREFLE_API_URL = os.getenv("TREFLE_API_URL", "https://trefle.io/api/v1/plants")
+TREFLE_TIMEOUT = float(os.getenv("TREFLE_TIMEOUT", "10"))
+TREFLE_CONNECT_TIMEOUT = float(os.getenv("TREFLE_CONNECT_TIMEOUT", "3"))
+TREFLE_RETRIES = int(os.getenv("TREFLE_RETRIES", "3"))
+TREFLE_RETRY_BACKOFF = float(os.getenv("TREFLE_RETRY_BACKOFF", "0.5"))
+TREFLE_MAX_CONNECTIONS = int(os.getenv("TREFLE_MAX_CONNECTIONS", "20"))
+
+# Настройки кэша
+TREFLE_CACHE_DIR = os.getenv("TREFLE_CACHE_DIR", "cache/trefle")
+TREFLE_CACHE_TTL = int(os.getenv("TREFLE_CACHE_TTL", "86400"))
+TREFLE_TOKEN_CHECK_TTL = int(os.getenv("TREFLE_TOKEN_CHECK_TTL", "300"))
+
+# Настройки circuit breaker
+TREFLE_BREAKER_THRESHOLD = int(os.getenv("TREFLE_BREAKER_THRESHOLD", "5"))
+TREFLE_BREAKER_RESET = float(os.getenv("TREFLE_BREAKER_RESET", "30"))
+
+# Статусы, при которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Ошибка обращения к Trefle API
+class TrefleError(Exception):
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Trefle недоступен: circuit breaker разомкнут
+class TrefleUnavailable(TrefleError):
+    pass
+
+
+# Circuit breaker: после серии ошибок отказывает сразу, не дергая Trefle
+class CircuitBreaker:
+    def __init__(self, threshold: int = TREFLE_BREAKER_THRESHOLD, reset_timeout: float = TREFLE_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        # До какого момента ждем результата пробного запроса в полуоткрытом состоянии
+        self.probe_until: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Можно ли сейчас отправлять запрос"""
+        state = self.state
+        if state != "half-open":
+            return state == "closed"
+        # В полуоткрытом состоянии пропускаем один пробный запрос, остальные ждут его результата.
+        # Если проба зависла или отменена, через reset_timeout пропускаем следующую.
+        now = time.monotonic()
+        if self.probe_until is not None and now < self.probe_until:
+            return False
+        self.probe_until = now + self.reset_timeout
+        return True
+
+    def retry_after(self) -> float:
+        """Сколько секунд осталось до пробного запроса"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_until = None
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_until = None
+        if self.state == "half-open" or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            logger.warning(f"Trefle circuit breaker разомкнут после {self.failures} ошибок")
+
+
+# Дисковый кэш JSON-ответов с TTL
+class DiskCache:
+    def __init__(self, directory: str = TREFLE_CACHE_DIR, ttl: int = TREFLE_CACHE_TTL):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self._swept_at = time.time()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _read(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, "r", encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key: str, value: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(value, cache_file)
+        # Атомарная замена, чтобы параллельные воркеры не читали половину файла
+        os.replace(tmp_path, path)
+        if time.time() - self._swept_at > self.ttl:
+            self._sweep()
+
+    def _sweep(self):
+        """Удаление устаревших записей, которые больше не запрашивались (раз в TTL)"""
+        self._swept_at = now = time.time()
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and now - entry.stat().st_mtime > self.ttl:
+                        os.unlink(entry.path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logger.info(f"Из кэша {self.directory} удалено устаревших записей: {removed}")
+
+    async def get(self, key: str) -> dict | None:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: dict):
+        try:
+            await asyncio.to_thread(self._write, key, value)
+        except OSError as e:
+            logger.warning(f"Не удалось записать кэш {key}: {e}")
+
+
+# Общий клиент Trefle API с пулом keep-alive соединений
+class TrefleClient:
+    def __init__(
+        self,
+        base_url: str = TREFLE_API_URL,
+        token: str | None = TREFLE_API_KEY,
+        retries: int = TREFLE_RETRIES,
+        backoff: float = TREFLE_RETRY_BACKOFF,
+        cache: DiskCache | None = None,
+        breaker: CircuitBreaker | None = None,
+        token_check_ttl: int = TREFLE_TOKEN_CHECK_TTL,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.base_url = base_url
+        self.token = token
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache or DiskCache()
+        self.breaker = breaker or CircuitBreaker()
+        self.token_check_ttl = token_check_ttl
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._token_check: tuple[float, int, str] | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Ленивое создание HTTP клиента (один на процесс)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(TREFLE_TIMEOUT, connect=TREFLE_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=TREFLE_MAX_CONNECTIONS,
+                    max_keepalive_connections=TREFLE_MAX_CONNECTIONS,
+                    keepalive_expiry=60,
+                ),
+                transport=self._transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _sleep_backoff(self, attempt: int):
+        # Экспоненциальная задержка с полным джиттером
+        await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    async def _get(self, url: str, use_breaker: bool = True, **kwargs) -> httpx.Response:
+        """GET запрос с повторами и учетом circuit breaker"""
+        if use_breaker and not self.breaker.allow():
+            raise TrefleUnavailable("Trefle API временно недоступен", status_code=503)
+
+        last_error: Exception | None = None
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.client.get(url, **kwargs)
+            except httpx.TransportError as e:
+                last_error = e
+                logger.warning(f"Ошибка соединения с {url} (попытка {attempt + 1}): {e}")
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if use_breaker:
+                        self.breaker.record_success()
+                    return response
+                last_error = TrefleError(f"Статус {response.status_code}", status_code=response.status_code)
+                logger.warning(f"Trefle вернул {response.status_code} для {url} (попытка {attempt + 1})")
+
+            if attempt < self.retries:
+                await self._sleep_backoff(attempt)
+
+        if use_breaker:
+            self.breaker.record_failure()
+        if isinstance(last_error, TrefleError):
+            raise last_error
+        raise TrefleError(f"Ошибка при подключении к Trefle API: {last_error}")
+
+    async def get_page(self, page: int) -> dict:
+        """Страница растений Trefle (из дискового кэша, если есть)"""
+        key = f"page_{page}"
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        response = await self._get(self.base_url, params={"page": page, "token": self.token})
+        if response.status_code != 200:
+            raise TrefleError(f"Ошибка API: {response.status_code}", status_code=response.status_code)
+
+        data = response.json()
+        await self.cache.set(key, data)
+        return data
+
+    async def check_token(self) -> tuple[int, str]:
+        """Статус и текст ответа Trefle для текущего токена (кэшируется на TTL)"""
+        if self._token_check is not None:
+            checked_at, status_code, text = self._token_check
+            if time.monotonic() - checked_at < self.token_check_ttl:
+                return status_code, text
+
+        response = await self._get(self.base_url, params={"token": self.token})
+        self._token_check = (time.monotonic(), response.status_code, response.text)
+        return response.status_code, response.text
+
+    async def download_image(self, url: str) -> httpx.Response:
+        """Загрузка изображения растения (сторонний хост, без circuit breaker)"""
+        headers = {
+            "Accept": "image/jpeg",  # Указание, что хотим получить изображение
+            "User-Agent": "Mozilla/5.0"
+        }
+        return await self._get(url, use_breaker=False, headers=headers)
+
+
+# Общий экземпляр клиента для приложения
+trefle_client = TrefleClient()
@@ -167,8 +167,14 @@ class UsersTab extends StatefulWidget {
 }
 
 class _UsersTabState extends State<UsersTab> {
+  static const int _pageSize = 100;
+
   List<dynamic> _users = [];
-  bool _isLoading = true;
+  bool _isLoading = true; // Загрузка первой страницы
+  bool _isLoadingMore = false;
+  bool _hasMore = true;
+  bool _loadError = false;
+  int? _lastUserId; // id последнего загруженного пользователя (пагинация по after_id)
 
   @override
   void initState() {
@@ -176,19 +182,45 @@ class _UsersTabState extends State<UsersTab> {
     _fetchUsers();
   }
 
+  // Загрузка следующей страницы пользователей (вызывается при прокрутке до конца списка)
   Future<void> _fetchUsers() async {
+    if (_isLoadingMore || !_hasMore) return;
+    _isLoadingMore = true;
+
     final response = await http.get(
-      Uri.parse('${Config.baseUrl}/admin/users'),
+      Uri.parse('${Config.baseUrl}/admin/users?limit=$_pageSize'
+          '${_lastUserId != null ? '&after_id=$_lastUserId' : ''}'),
       headers: {"Authorization": "Bearer ${widget.token}"},
     );
+    if (!mounted) return;
+
     if (response.statusCode == 200) {
+      final List<dynamic> page = json.decode(response.body);
+      setState(() {
+        _users.addAll(page);
+        _hasMore = page.length == _pageSize;
+        if (page.isNotEmpty) _lastUserId = page.last['id'];
+        _loadError = false;
+        _isLoading = false;
+        _isLoadingMore = false;
+      });
+    } else {
       setState(() {
-        _users = json.decode(response.body);
+        _loadError = true;
         _isLoading = false;
+        _isLoadingMore = false;
       });
+      ScaffoldMessenger.of(context).showSnackBar(
+        SnackBar(content: Text("Ошибка загрузки пользователей")),
+      );
     }
   }
 
+  void _retryFetchUsers() {
+    setState(() => _loadError = false);
+    _fetchUsers();
+  }
+
   Future<void> _deleteUser(int userId) async {
     final response = await http.delete(
       Uri.parse('${Config.baseUrl}/admin/users/$userId'),
@@ -209,8 +241,25 @@ class _UsersTabState extends State<UsersTab> {
     }
 
     return ListView.builder(
-      itemCount: _users.length,
+      itemCount: _users.length + (_hasMore ? 1 : 0),
       itemBuilder: (context, index) {
+        if (index == _users.length) {
+          // Конец списка: после ошибки ждем повтора вручную, иначе подгружаем следующую страницу
+          if (_loadError) {
+            return Center(
+              child: TextButton(
+                onPressed: _retryFetchUsers,
+                child: const Text("Повторить"),
+              ),
+            );
+          }
+          _fetchUsers();
+          return const Padding(
+            padding: EdgeInsets.all(16.0),
+            child: Center(child: CircularProgressIndicator()),
+          );
+        }
+
         final user = _users[index];
         return ListTile(
           title: Text(user['username']),
@@ -22,7 +22,7 @@ class _MainScreenState extends State<MainScreenUser> {
   List<dynamic> _favorites = [];
   List<dynamic> _filteredPlants = [];
   Set<int> _favoritePlantIds = {}; // Для отслеживания избранного
-  int _offset = 0;
+  int? _lastPlantId; // id последнего растения из каталога (пагинация по after_id)
   bool _isLoading = false;
   bool _isFavoritesTab = false;
   final TextEditingController _searchController = TextEditingController();
@@ -52,7 +52,8 @@ class _MainScreenState extends State<MainScreenUser> {
     setState(() => _isLoading = true);
 
     final response = await http.get(
-      Uri.parse('${Config.baseUrl}/plants?offset=$_offset&limit=5'),
+      Uri.parse('${Config.baseUrl}/plants?limit=5'
+          '${_lastPlantId != null ? '&after_id=$_lastPlantId' : ''}'),
       headers: {"Authorization": "Bearer ${widget.token}"},
     );
 
@@ -72,7 +73,7 @@ class _MainScreenState extends State<MainScreenUser> {
             }
           }
           _filteredPlants = List.from(_plants);
-          _offset += 5;
+          _lastPlantId = newPlants.last['id'];
         });
       }
     } else {
@@ -93,7 +94,7 @@ class _MainScreenState extends State<MainScreenUser> {
 
       if (randomPlants.isNotEmpty) {
         setState(() {
-          // Добавляем растения и увеличиваем смещение
+          // Добавляем растения (дубликаты из каталога отсеиваются по id)
           for (var plant in randomPlants) {
             if (!_plants
                 .any((existingPlant) => existingPlant['id'] == plant['id'])) {
@@ -101,7 +102,6 @@ class _MainScreenState extends State<MainScreenUser> {
             }
           }
           _filteredPlants = List.from(_plants);
-          _offset += 5;
         });
       } else {
         _showError("Случайные растения не найдены.");